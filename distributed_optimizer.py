@@ -70,7 +70,7 @@ CONFIG["optimizer"] = {
         "dropout1": [0.1, 1],
         "maxpool1": [2, 10],
         "maxpool2": [2, 10],
-        'batch_size': [2, 7],
+        'batch_size': [32, 256],
         'lr': [0.001, 10.0]
     },
     "initial_candidates": None,
@@ -1,5 +1,5 @@
 from dopt.optimizers import *
-from dopt.trainer import Trainer
+from dopt.trainer import Trainer, report_intermediate
 from dopt.server import Server
 
 __version__ = "0.0.3.18"
@@ -8,5 +8,6 @@ __all__ = [
     "Trainer",
     "Optimizer",
     "NEIOptimizer",
-    "Server"
+    "Server",
+    "report_intermediate"
 ]
@@ -33,6 +33,12 @@ from dopt.optimizers.optimizer import Optimizer
 from dopt.utils import generate_seed
 
 
+def _candidate_params(candidate: Dict[str, Any]) -> List[Any]:
+    r"""Values of a candidate's search-space parameters, without the
+    bookkeeping keys the Optimizer attaches ("id", "budget")."""
+    return [v for k, v in candidate.items() if k not in ("id", "budget")]
+
+
 class qNEIModified(qNoisyExpectedImprovement):
     def __init__(self, model: Model, X_baseline: Tensor,
         sampler: Optional[MCSampler] = None,
@@ -93,14 +99,18 @@ class NEIOptimizer(Optimizer):
             initial_candidates: Optional[list] = [],
             device: Optional[str] = "cpu",
             seed: Optional[int] = random.randint(1, 100000),
+            max_budget: Optional[int] = None,
+            eta: int = 3,
         ) -> None:
         r"""Constructor for  Bayesian optimizer that use Noisy Expected Improvement
-        as the acquisition function. 
-        
+        as the acquisition function.
+
         :param device:              Generate candidates on the chosen device.
         :param bounds:              Boundaries to the search space.
+        :param max_budget:          Enables successive halving, see base class.
         """
-        super().__init__(file_name, bounds=bounds, seed=seed)
+        super().__init__(file_name, bounds=bounds, seed=seed,
+                         max_budget=max_budget, eta=eta)
         self.device = device
         self.current_model = None
         self.num_constraints = None
@@ -132,7 +142,7 @@ class NEIOptimizer(Optimizer):
         train_x, train_obj, train_var= [], [], []
         train_cons = [[] for i in range(self.num_constraints)]
         for o in self.observations:
-            train_x.append(list(o["candidate"].values())[:-1]) # Last key of candidate is id
+            train_x.append(_candidate_params(o["candidate"]))
             train_obj.append(o["objective"][0])
             train_var.append(o["objective"][1])
             for i in range(self.num_constraints):
@@ -202,10 +212,10 @@ class NEIOptimizer(Optimizer):
         
     def generate_candidate(self) -> Dict[str, Any]:
         r"""Draw the best candidate to evaluate based on known observations.
-        
+
         :param is_random: Set to True if want to generate randomly
         """
-        
+
         if len(self.initial_candidates) > 0:
             candidate = self.initial_candidates.pop()
             candidate = dict(sorted(candidate.items()))
@@ -216,6 +226,20 @@ class NEIOptimizer(Optimizer):
             print("Generating initial candidate(s)")
             return self._generate_random_candidate()
 
+        return self._optimize_candidates(q=1)[0]
+
+    def generate_candidates(self, n: int) -> List[Dict[str, Any]]:
+        r"""Draw ``n`` candidates with a single model fit, using a
+        joint q-batch acquisition instead of ``n`` separate GP refits."""
+        if n <= 1 or len(self.initial_candidates) > 0 \
+                or len(self.observations) == 0:
+            # Initial/random candidates are cheap, no fit to amortize
+            return [self.generate_candidate() for _ in range(n)]
+        return self._optimize_candidates(q=n)
+
+    def _optimize_candidates(self, q: int = 1) -> List[Dict[str, Any]]:
+        r"""Fit the model once and optimize the acquisition function
+        for a joint batch of ``q`` candidates."""
         mll, model = self._initialize_model()
         fit_gpytorch_model(mll)
         self._initialize_acqf()
@@ -227,10 +251,10 @@ class NEIOptimizer(Optimizer):
 
         # Try-except to handle a weird bug
         try:
-            torch_candidate, _ = optimize_acqf(
+            torch_candidates, _ = optimize_acqf(
                 acq_function=self.qNEI,
                 bounds=bounds_torch,
-                q=1,              # Generate only one candidate at a time
+                q=q,
                 num_restarts=10,  # ???
                 raw_samples=500,  # Sample on GP using Sobel sequence
                 options={
@@ -238,23 +262,24 @@ class NEIOptimizer(Optimizer):
                     "max_iter": 200,
                     "seed": generate_seed()
                 }
-            )  
+            )
         except NanError as e:
             raise Exception("NanError again. There's no way to solve it yet !!!")
 
         # Put parameters together
-        candidate = {}
-        for i, key in enumerate(self.get_labels()):
-            candidate[key] = torch_candidate.cpu().numpy()[0][i]
+        candidates = []
+        for row in torch_candidates.cpu().numpy().reshape(q, -1):
+            candidates.append({key: row[i]
+                               for i, key in enumerate(self.get_labels())})
 
-        return candidate
+        return candidates
         
     def observation_to_candidate_tensor(self):
-        return torch.tensor([list(o["candidate"].values())[:-1] for o in self.observations], 
+        return torch.tensor([_candidate_params(o["candidate"]) for o in self.observations],
                      device=self.device, dtype=NEIOptimizer.DTYPE)
 
     def pending_candidate_list_to_tensor(self):
-        t = torch.tensor([list(c.values())[:-1] for c in self.pending_candidates], 
+        t = torch.tensor([_candidate_params(c) for c in self.pending_candidates.values()],
                      device=self.device, dtype=NEIOptimizer.DTYPE)
         if t.shape[-1] == 0:
             return None
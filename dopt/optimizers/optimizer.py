@@ -1,10 +1,16 @@
 import asyncio
+import hashlib
 from abc import ABC, abstractmethod
 from typing import Dict, List, Any, Union, Tuple, Optional
 import json
-import math
+import logging
+import os
+import queue
 from os import path
 import random
+import signal
+import sys
+from threading import Thread
 
 import torch
 import numpy as np
@@ -13,6 +19,27 @@ from multiprocessing.connection import Connection
 
 from dopt.utils import generate_seed
 
+# orjson is a C-accelerated JSON library, typically several times
+# faster than the stdlib on both dumps and loads. Fall back to the
+# stdlib if it's not installed.
+try:
+    import orjson
+
+    # Candidates built from np.random / tensor.numpy() carry numpy
+    # scalars, which orjson rejects unless OPT_SERIALIZE_NUMPY is set
+    # (stdlib json accepts them as float subclasses)
+    def _loads(s):
+        return orjson.loads(s)
+
+    def _dumps_bytes(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+except ImportError:
+    def _loads(s):
+        return json.loads(s)
+
+    def _dumps_bytes(obj):
+        return json.dumps(obj, separators=(",", ":")).encode()
+
 # TODO: Use logging instead of print
 # Multiple objective functions?
 # TODO: Deal with ordering problem
@@ -24,20 +51,52 @@ class Optimizer(ABC):
     """
     MAX_OBSERVATIONS = 500
     HEADER_REMOVE_CANDIDATE = "Remove: "
+    HEADER_INTERMEDIATE = "Intermediate: "
+    BUCKET_CAP_BYTES = 64 * 1024
+    FLUSH_EVERY_N_WRITES = 16
 
-    def __init__(self, 
+    def __init__(self,
                  filename: str,
                  bounds: Dict[str, Tuple[float, float]],
-                 seed: Optional[int] = random.randint(1, 100000)) -> None:
+                 seed: Optional[int] = random.randint(1, 100000),
+                 bucket_cap_bytes: int = BUCKET_CAP_BYTES,
+                 max_budget: Optional[int] = None,
+                 eta: int = 3) -> None:
         r""" Constructor for Optimizer base class.
-        
+
         :param filename:   Name of the file
                             that stores observations
         :param bounds:      Boundaries to the search space
         :param seed:        To ensure reproducibility
+        :param bucket_cap_bytes: Observations are buffered until this
+                            many bytes accumulate, then written and
+                            fsynced in one go
+        :param max_budget:  Enables successive halving. Candidates are
+                            first evaluated on a small budget (e.g.
+                            epochs) and only the top 1/eta of each
+                            cohort is resumed with eta times the
+                            budget, up to max_budget. None (default)
+                            runs every candidate to completion
+        :param eta:         Halving rate for successive halving
         """
         self.filename = filename
         self.bounds = dict(sorted(bounds.items()))
+        self.bucket_cap_bytes = bucket_cap_bytes
+
+        # Successive-halving state; inert unless max_budget is set.
+        # _rungs collects partial scores per rung, _rung_of tracks the
+        # rung each live candidate is running at
+        self.max_budget = max_budget
+        self.eta = eta
+        self._rungs: Dict[int, List[Dict]] = {}
+        self._rung_of: Dict[int, int] = {}
+        # Ids dropped by a halving cut whose trainers may still be
+        # running; late messages about them are ignored, not errors
+        self._halted_ids: set = set()
+
+        # Results of expensive pipeline stages (e.g. dataset prep),
+        # shared across candidates whose prefix hyperparameters agree
+        self.stage_cache: Dict[Tuple[str, str], Any] = {}
         
         # Ensure reproducibility
         random.seed(seed)
@@ -48,10 +107,24 @@ class Optimizer(ABC):
         # [{"candidate":..., "result":...}, ...}]
         self.observations: List[Dict[str, Dict]] = []
         self._load_observations()
+
+        # Keep one append-mode handle open for the optimizer's lifetime
+        # instead of reopening the file per observation. Serialized
+        # lines are bucketed and written/fsynced together
+        self._obs_fp = open(self.filename, "ab", buffering=1<<16)
+        self._pending_writes: List[bytes] = []
+        self._bucket_bytes = 0
         
-        # List of pending hyperparameters, length = number of Trainers
-        # [{"num_batch":..., "num_iter":...}, ...]
-        self.pending_candidates: List[Dict[str, Dict]] = []
+        # Pending hyperparameters keyed by candidate id,
+        # length = number of Trainers
+        # {1: {"num_batch":..., "num_iter":...}, ...}
+        self.pending_candidates: Dict[int, Dict] = {}
+
+        # Incremental id allocation. Ids only need to be unique,
+        # not densely packed, so a counter is enough
+        self._next_id = 1 + max(
+            (o["candidate"]["id"] for o in self.observations), default=0)
+        self._live_ids = {o["candidate"]["id"] for o in self.observations}
             
         # Connection with server
         self.server_conn = None
@@ -76,19 +149,50 @@ class Optimizer(ABC):
         r"""Load observations from existing file. If file doesn't
         exist, create a new file"""
         if path.exists(self.filename):
-            # Load observations
-            with open(self.filename, "r") as f:
-                for line in f.readlines():
-                    self.observations.append(json.loads(line))
+            # Load observations. One read + a comprehension keeps the
+            # per-line work inside the JSON parser (which runs in C
+            # and, with orjson, releases the GIL) instead of paying
+            # Python iteration dispatch per line
+            with open(self.filename, "rb") as f:
+                data = f.read()
+            self.observations = [_loads(line)
+                                 for line in data.splitlines() if line]
         else:
             # Create a new file
             with open(self.filename, "w") as f:
                 pass
     
     def _save_observation(self, observation):
-        r"""Save ONE acquired observation into a storing file"""
-        with open(self.filename, "a") as f:
-            f.write(json.dumps(observation, indent=None) + "\n")
+        r"""Save ONE acquired observation into a storing file.
+        Lines accumulate in a bucket and hit the disk together once
+        ``bucket_cap_bytes`` worth are pending."""
+        line = _dumps_bytes(observation) + b"\n"
+        self._pending_writes.append(line)
+        self._bucket_bytes += len(line)
+        # The count trigger bounds how many observations an abrupt
+        # kill can lose; each one represents a full training run
+        if self._bucket_bytes >= self.bucket_cap_bytes or \
+                len(self._pending_writes) >= Optimizer.FLUSH_EVERY_N_WRITES:
+            self._flush_observations()
+
+    def _flush_observations(self):
+        r"""Write the bucket of pending observations with a single
+        writelines + fsync."""
+        if not self._pending_writes:
+            return
+        self._obs_fp.writelines(self._pending_writes)
+        self._obs_fp.flush()
+        os.fsync(self._obs_fp.fileno())
+        self._pending_writes.clear()
+        self._bucket_bytes = 0
+
+    def _close_observation_file(self):
+        if getattr(self, "_obs_fp", None) is not None and not self._obs_fp.closed:
+            self._flush_observations()
+            self._obs_fp.close()
+
+    def __del__(self):
+        self._close_observation_file()
             
     def remove_pending_candidate(self, observation):
         """Candidates from returning observations, successful or failed,
@@ -96,12 +200,17 @@ class Optimizer(ABC):
         
         :param observation: A single observation
         """
-        candidate_to_remove = observation["candidate"]
-        if candidate_to_remove not in self.pending_candidates:
+        candidate_id = observation["candidate"]["id"]
+        if candidate_id not in self.pending_candidates:
+            if candidate_id in self._halted_ids:
+                # Already dropped by a successive-halving cut; the
+                # trainer/server just hadn't heard yet
+                self._halted_ids.discard(candidate_id)
+                self._live_ids.discard(candidate_id)
+                return
             raise Exception("Candidate not found in pending candidates!")
-        self.pending_candidates = [candidate 
-                                   for candidate in self.pending_candidates
-                                   if candidate != candidate_to_remove]
+        del self.pending_candidates[candidate_id]
+        self._live_ids.discard(candidate_id)
 
     def run(self, conn, logger, lock) -> None:
         """Optimization loop. 
@@ -109,63 +218,266 @@ class Optimizer(ABC):
         candidate(s) from Server, and then generate, and so
         on."""
         self._set_server_connection(conn)
+
+        # The Server ends this process with SIGTERM; drain any bucketed
+        # observations before dying so they aren't lost
+        def _on_sigterm(signum, frame):
+            self._close_observation_file()
+            sys.exit(0)
+        try:
+            signal.signal(signal.SIGTERM, _on_sigterm)
+        except ValueError:
+            # Not the process's main thread (e.g. run in tests);
+            # rely on the size/count flush triggers
+            pass
+
+        # Replies are pushed onto a queue drained by a background
+        # thread, so the pipe send overlaps with the next candidate
+        # generation. The queue is FIFO, so replies still reach the
+        # server in the order they were generated. send_bytes skips
+        # the pickle layer and just frames the payload.
+        send_q: "queue.Queue" = queue.Queue()
+        def _drain_send_queue():
+            while True:
+                message = send_q.get()
+                if message is None:
+                    break
+                self.server_conn.send_bytes(message)
+        sender = Thread(target=_drain_send_queue, daemon=True)
+        sender.start()
+
+        # Hoisted out of the loop to skip repeated attribute lookups
+        # per response; each dot here is a dict probe in the hot loop
+        _HDR = Optimizer.HEADER_REMOVE_CANDIDATE
+        _HDR_LEN = len(_HDR)
+        _IHDR = Optimizer.HEADER_INTERMEDIATE
+        _IHDR_LEN = len(_IHDR)
+        _recv = self.server_conn.recv_bytes
+        _poll = self.server_conn.poll
+        _append_obs = self.observations.append
+        _save = self._save_observation
+        _rm = self.remove_pending_candidate
+        _put = send_q.put_nowait
+        _debug = logger.isEnabledFor(logging.DEBUG)
         while self.is_running():
             try:
-                responses = self.server_conn.recv()
-                with lock:
-                    logger.debug(f"Optimizer received: {responses}")
+                responses = _recv().decode("utf8")
+                # Drain anything else already queued so one candidate
+                # batch covers the whole burst
+                while _poll(0):
+                    responses += _recv().decode("utf8")
+                if _debug:
+                    with lock:
+                        logger.debug(f"Optimizer received: {responses}")
             except EOFError:
                 # When the other end is closed
                 with lock:
                     logger.debug("Exitting Optimizer")
+                send_q.put(None)
+                self._close_observation_file()
                 return
             
-            # Handle the server's response(s)
-            for response in responses.split("\n")[:-1]:    
+            # Handle the server's response(s). Each "{}" or observation
+            # response asks for one fresh candidate; removals don't.
+            num_requested = 0
+            for response in responses.splitlines():
                 response = response.strip()
+                if not response:
+                    continue
                 if response == "{}":
                     pass
-                elif Optimizer.HEADER_REMOVE_CANDIDATE in response:
+                elif _HDR in response:
                     # Remove pending candidate
-                    candidate = json.loads(response[len(Optimizer.HEADER_REMOVE_CANDIDATE):].strip())
-                    self.remove_pending_candidate({"candidate": candidate})
-                    with lock:
-                        logger.debug(f"Removed candidate: {candidate}")
+                    candidate = _loads(response[_HDR_LEN:].strip())
+                    _rm({"candidate": candidate})
+                    if _debug:
+                        with lock:
+                            logger.debug(f"Removed candidate: {candidate}")
+                    continue
+                elif _IHDR in response:
+                    # Partial-budget score: run a successive-halving
+                    # cut and resume any promoted candidates
+                    report = _loads(response[_IHDR_LEN:].strip())
+                    promoted = self.report_intermediate(
+                        report["id"], report["score"])
+                    if promoted:
+                        _put(_dumps_bytes({"candidates": promoted}))
+                        if _debug:
+                            with lock:
+                                logger.debug(f"Promoted candidates: {promoted}")
                     continue
                 else:
-                    observation = json.loads(response)
-                    if observation["contention_failure"] == False:
-                        self.observations.append(observation)
-                        self._save_observation(observation) 
-                    self.remove_pending_candidate(observation) 
-                
-                 # Find one potential candidate to try next based on the info
-                candidate: Dict[str, Any] = self.generate_candidate()
-                candidate["id"] = self.generate_id()
-                self.pending_candidates.append(candidate)
-
-                reply = json.dumps({"candidate": candidate})
-                self.server_conn.send(reply)                # <---- This
+                    observation = _loads(response)
+                    promoted = self._consume_partial_observation(observation)
+                    if promoted is None:
+                        if observation["contention_failure"] == False:
+                            _append_obs(observation)
+                            _save(observation)
+                        _rm(observation)
+                    elif promoted:
+                        _put(_dumps_bytes({"candidates": promoted}))
+                num_requested += 1
+
+            if num_requested > 0:
+                # Find candidates to try next based on the info, in one
+                # batch so subclasses can amortize model fitting
+                candidates = self.generate_candidates(num_requested)
+                for candidate in candidates:
+                    candidate["id"] = self.generate_id()
+                    self._assign_initial_budget(candidate)
+                    self.pending_candidates[candidate["id"]] = candidate
+
+                reply = _dumps_bytes({"candidates": candidates})
+                _put(reply)
+                if _debug:
+                    with lock:
+                        logger.debug(f"Optimizer sent: {reply}")
+
+            # Lazy %s formatting so the pending set is only serialized
+            # when a handler will actually emit the record
+            if _debug:
                 with lock:
-                    logger.debug(f"Optimizer sent: {reply}")
-                
-            with lock:
-                logger.debug(f"Number of observations: {len(self.observations)}")
-                logger.debug(f"Number of pending candidates: {len(self.pending_candidates)}")
-                logger.debug(f"Pending candidates: {json.dumps(self.pending_candidates)}")
-                logger.warning(f"Pending candidates: {json.dumps(self.pending_candidates)}")
-          
-            
+                    logger.debug("Number of observations: %d", len(self.observations))
+                    logger.debug("Number of pending candidates: %d", len(self.pending_candidates))
+                    logger.debug("Pending candidates: %s", list(self.pending_candidates.values()))
+
+        send_q.put(None)
+        sender.join()
+        self._close_observation_file()
+
+
+    @staticmethod
+    def _stage_key(stage: str, prefix_hp: Dict[str, Any]) -> Tuple[str, str]:
+        r"""Content-address a pipeline stage by a canonical-JSON hash
+        of the hyperparameters that affect it."""
+        canonical = json.dumps(prefix_hp, sort_keys=True, default=str)
+        return (stage, hashlib.sha1(canonical.encode()).hexdigest())
+
+    def get_cached(self, stage: str, prefix_hp: Dict[str, Any]) -> Any:
+        r"""Look up a previously computed stage result. Returns None
+        on a cache miss.
+
+        :param stage:     Name of the pipeline stage
+        :param prefix_hp: The subset of hyperparameters the stage
+                          depends on
+        """
+        return self.stage_cache.get(self._stage_key(stage, prefix_hp))
+
+    def put_cached(self, stage: str, prefix_hp: Dict[str, Any], value: Any) -> None:
+        r"""Store a stage result for reuse by later candidates that
+        share the same prefix hyperparameters."""
+        self.stage_cache[self._stage_key(stage, prefix_hp)] = value
+
+    def _num_rungs(self) -> int:
+        # Integer arithmetic: int(math.log(243, 3)) is 4 because the
+        # float log lands just under 5, which would silently drop a
+        # rung whenever max_budget is an exact power of eta
+        k = 0
+        while self.eta ** (k + 1) <= self.max_budget:
+            k += 1
+        return max(1, k)
+
+    def _budget_for_rung(self, rung: int) -> int:
+        r"""Budget at rung ``r``: max_budget / eta^(num_rungs - r),
+        so the top rung runs at the full budget."""
+        return max(1, int(self.max_budget * self.eta ** (rung - self._num_rungs())))
+
+    def _assign_initial_budget(self, candidate):
+        r"""Attach the rung-0 budget to a freshly generated candidate
+        when successive halving is enabled."""
+        if self.max_budget is None:
+            return
+        candidate["budget"] = self._budget_for_rung(0)
+        self._rung_of[candidate["id"]] = 0
+
+    def report_intermediate(self, candidate_id: int, score: float) -> List[Dict]:
+        r"""Record a partial-budget score for a candidate and perform a
+        successive-halving cut on its rung. Once ``eta`` candidates have
+        reported at a rung, the top 1/eta are promoted to the next rung
+        with ``eta`` times the budget and returned so they can be resumed
+        on a Trainer; the rest are dropped from the pending set.
+
+        :param candidate_id: Id of the reporting candidate
+        :param score:        Objective estimate at the current budget
+                             (higher is better)
+        :return: Candidates promoted to the next rung, to be re-sent
+        """
+        if self.max_budget is None:
+            return []
+        rung = self._rung_of.get(candidate_id, 0)
+        if rung >= self._num_rungs():
+            # Top-rung candidates run to full budget; no further cut
+            # will consume their reports, so don't accumulate them
+            return []
+        self._rungs.setdefault(rung, []).append(
+            {"id": candidate_id, "score": score})
+        records = self._rungs[rung]
+        if len(records) < self.eta:
+            return []
+
+        # Full cohort reported: promote the top 1/eta, halt the rest
+        records.sort(key=lambda r: r["score"], reverse=True)
+        num_promoted = max(1, len(records) // self.eta)
+        promoted = []
+        for record in records[:num_promoted]:
+            candidate = self.pending_candidates.get(record["id"])
+            if candidate is None:
+                continue
+            self._rung_of[record["id"]] = rung + 1
+            candidate["budget"] = self._budget_for_rung(rung + 1)
+            promoted.append(candidate)
+        for record in records[num_promoted:]:
+            if record["id"] in self.pending_candidates:
+                del self.pending_candidates[record["id"]]
+            self._rung_of.pop(record["id"], None)
+            self._halted_ids.add(record["id"])
+        self._rungs[rung] = []
+        return promoted
+
+    def _consume_partial_observation(self, observation) -> Optional[List[Dict]]:
+        r"""Decide whether an incoming observation is really a
+        partial-budget result. Returns None for a full-budget result
+        that should be recorded normally; otherwise consumes the
+        observation as an intermediate report and returns any
+        candidates promoted by the resulting cut. This is what makes
+        successive halving work with unmodified objective functions:
+        a run at a lower rung ends like any other, and its observation
+        is folded into the rung scores here instead of the GP data."""
+        if self.max_budget is None:
+            return None
+        candidate_id = observation["candidate"]["id"]
+        if candidate_id in self._halted_ids:
+            # Cut already dropped this candidate mid-run
+            self._halted_ids.discard(candidate_id)
+            self._live_ids.discard(candidate_id)
+            return []
+        if observation["contention_failure"]:
+            # The trainer's OOM/contention sentinel, not a score; let
+            # the normal path drop the candidate (un-recorded) and
+            # request a fresh one instead of scoring the rung with it
+            self._rung_of.pop(candidate_id, None)
+            return None
+        rung = self._rung_of.get(candidate_id)
+        if rung is None or rung >= self._num_rungs():
+            # Top-rung (full budget) result: record it normally
+            self._rung_of.pop(candidate_id, None)
+            return None
+        return self.report_intermediate(
+            candidate_id, observation["objective"][0])
+
     def generate_id(self):
-        current_ids = [o["candidate"]["id"] for o in self.observations]
-        current_ids += [candidate["id"] for candidate in self.pending_candidates]
-        i = 1
-        while i <= len(current_ids) + 1:
-            if i not in current_ids:
-                break
-            i += 1    
+        i = self._next_id
+        self._next_id += 1
+        self._live_ids.add(i)
         return i
         
+    def generate_candidates(self, n: int) -> List[Dict[str, Any]]:
+        r"""Draw ``n`` candidates at once. The default loops
+        :meth:`generate_candidate`; subclasses whose candidate generation
+        has a large fixed cost (e.g. fitting a model) should override
+        this to pay that cost once per batch."""
+        return [self.generate_candidate() for _ in range(n)]
+
     @abstractmethod
     def generate_candidate(self) \
             -> Dict[str, Any]:
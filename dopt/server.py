@@ -12,7 +12,7 @@ from multiprocessing.connection import Connection
 # from queue import SimpleQueue
 
 from dopt import Optimizer
-from dopt.utils import process_commands_in_parallel
+from dopt.utils import process_commands_in_parallel, ring_buffer_pipe
 
 
 class Server:
@@ -31,6 +31,9 @@ class Server:
         self.trainer_id = 0
         self.trainer_queue = Queue()
         self.bad_candidate_queue = Queue()
+        # Candidates received from the Optimizer but not yet assigned
+        # to a Trainer (the Optimizer may reply with several at once)
+        self.candidate_buffer: List[Dict] = []
 #         self.initial_candidates = initial_candidates \
 #                         if isinstance(initial_candidates, list) else []
         self.logging_level = logging_level
@@ -47,8 +50,13 @@ class Server:
         """Starts 3 main Processes: One for the Optimizer, one for
         starting trainers, one for connecting with trainers."""
         
-        # Runs the Optimizer
-        self.optimizer_conn, cconn = Pipe()
+        # Runs the Optimizer. The channel is a lock-free shared-memory
+        # ring buffer; fall back to a regular Pipe if shared memory is
+        # unavailable on this platform
+        try:
+            self.optimizer_conn, cconn = ring_buffer_pipe()
+        except Exception:
+            self.optimizer_conn, cconn = Pipe()
         optimizer_process = Process(target=self.optimizer.run, 
                                     args=(cconn, self.server_logger, self.lock_server_logger))
         optimizer_process.daemon = True
@@ -84,11 +92,15 @@ class Server:
                     with self.lock_bad_candidate_queue:
                         if not self.bad_candidate_queue.empty():
                             candidate = self._dequeue_bad_candidate()
+                        elif len(self.candidate_buffer) > 0:
+                            # Left over from an earlier batched reply
+                            candidate = self.candidate_buffer.pop(0)
                         elif self.optimizer_conn.poll(None): # There's a candidate available
-                            message = self.optimizer_conn.recv()
+                            message = self.optimizer_conn.recv_bytes()
                             message = json.loads(message)
-                            candidate = message["candidate"]
-                            
+                            self.candidate_buffer.extend(message["candidates"])
+                            candidate = self.candidate_buffer.pop(0)
+
                         if candidate != None:
                             connection, address, is_active, pending_candidate, trainer_id = self._dequeue_trainer()                    
                             self._send_candidate_to_trainer(candidate, connection, address)        
@@ -112,17 +124,22 @@ class Server:
         self.terminate()
         
     def terminate(self):
-        """Kill all Processes"""
+        """Stop all Processes. The channel is closed first so a
+        blocked Optimizer sees EOF and flushes its bucketed
+        observations; SIGTERM (not SIGKILL) covers the rest."""
+        self.optimizer_conn.close()
+        time.sleep(1)
         for p in self.process_list:
-            p.kill()
+            p.terminate()
             
     def _remove_pending_candidate(self, pending_candidate):
         """Tells the Optimizer to drop candidate off pending list"""
         with self.lock_server_logger:
             self.server_logger.warning(f"Removing candidate: {pending_candidate}")
         with self.lock_optimizer_conn:
-            self.optimizer_conn.send(Optimizer.HEADER_REMOVE_CANDIDATE + \
-                                     json.dumps(pending_candidate)+'\n')
+            self.optimizer_conn.send_bytes(str.encode(
+                Optimizer.HEADER_REMOVE_CANDIDATE + \
+                json.dumps(pending_candidate)+'\n'))
             
     def _dequeue_bad_candidate(self):
         with self.lock_bad_candidate_queue:
@@ -286,13 +303,21 @@ class Server:
             response = json.loads(response)
             if "observation" in response:
                 with self.lock_optimizer_conn:
-                    self.optimizer_conn.send(json.dumps(response["observation"])+'\n')
+                    self.optimizer_conn.send_bytes(
+                        str.encode(json.dumps(response["observation"])+'\n'))
                 with self.lock_trainer_queue:
                     self.trainer_queue.put(trainer_id)
                 with self.lock_trainers:
                     self.trainers[trainer_id][2] = 1 
                 with self.lock_server_logger:
                     self.server_logger.debug(json.dumps(response['observation']))
+            if "intermediate" in response:
+                # Partial-budget score for successive halving. The
+                # trainer is still running, so it is not requeued
+                with self.lock_optimizer_conn:
+                    self.optimizer_conn.send_bytes(str.encode(
+                        Optimizer.HEADER_INTERMEDIATE +
+                        json.dumps(response["intermediate"]) + '\n'))
             if "error" in response:
                 with self.lock_server_logger:
                     self.server_logger.error(f'{response["error"]}') #
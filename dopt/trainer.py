@@ -23,6 +23,26 @@ NUM_BYTES_RECEIVE = 1024
 MAXIMUM_ALLOWED_GPU_PERCENTAGE = 0.9
 SERVER_TRAINER_MESSAGE_INTERVAL = 5
 
+# Pipe back to the Trainer parent process; set while an objective
+# function is being evaluated so report_intermediate can reach it
+_intermediate_conn = None
+
+
+def report_intermediate(candidate, score):
+    """Stream a partial-budget score back to the Optimizer from inside
+    an objective function. Used for successive halving (see
+    Optimizer's max_budget): call it when the run has consumed
+    candidate["budget"] worth of resource, with the objective estimate
+    so far. No-op outside a Trainer evaluation.
+
+    :param candidate: The candidate being evaluated (needs its "id")
+    :param score:     Objective estimate at the current budget
+    """
+    if _intermediate_conn is None:
+        return
+    _intermediate_conn.send(json.dumps(
+        {"intermediate": {"id": candidate["id"], "score": score}}) + "\n")
+
 
 class PipeConnectionHandler(logging.Handler):
     """
@@ -179,6 +199,9 @@ class Trainer:
                         # Handle response from objective function process
                         # and relay message to the Server
                         sv_reply = {}
+                        if "intermediate" in response:
+                            # Partial-budget score, relay to the Server
+                            sv_reply["intermediate"] = response["intermediate"]
                         if "objective" in response:
                             sv_reply["observation"] = response
                             with self.lock_max_gpu_usage:
@@ -230,6 +253,10 @@ class Trainer:
             
 
     def evaluate_objective_function(self, cconn):
+        # Let report_intermediate reach the parent from objective code
+        global _intermediate_conn
+        _intermediate_conn = cconn
+
         # Child logger will report to the main logger
         child_logger = logging.getLogger('child')
         conn_handler = PipeConnectionHandler(cconn)
@@ -1,2 +1,3 @@
 from .ssh_utils import process_commands_in_parallel
-from .general_utils import get_output_shape, generate_seed, timer, add_prefix_to_print, get_all_gpu_processes_info
\ No newline at end of file
+from .general_utils import get_output_shape, generate_seed, timer, add_prefix_to_print, get_all_gpu_processes_info
+from .ring_buffer import ring_buffer_pipe, RingBufferConnection
\ No newline at end of file
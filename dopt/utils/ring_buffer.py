@@ -0,0 +1,173 @@
+r"""
+Single-consumer ring buffers over shared memory. `ring_buffer_pipe`
+returns a pair of endpoints exposing the subset of the
+`multiprocessing.connection.Connection` API the Optimizer/Server
+channel uses (`send_bytes`, `recv_bytes`, `poll`, `close`), so it can
+stand in for `multiprocessing.Pipe` without either side changing,
+while skipping the pipe's syscall-per-message and pickle framing
+overhead. The consumer side is lock-free; producers are serialized by
+a cross-process lock because the server writes to the optimizer from
+more than one process.
+"""
+import time
+from multiprocessing import Lock, Value
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+HEADER_SIZE = 4
+DEFAULT_CAPACITY = 1 << 20
+# Sleep between polls while waiting on the other side. Messages are
+# small and rare relative to this, so busy-spinning harder buys nothing
+SPIN_SLEEP = 0.0005
+
+
+class RingBufferChannel:
+    r"""One direction of the channel. A producer writes a 4-byte
+    little-endian length followed by the payload at the head offset;
+    the consumer reads at the tail offset. Head and tail are
+    monotonically increasing byte counts, only ever advanced past data
+    that is fully in place, so the single consumer needs no lock.
+    Producers take ``producer_lock`` around the reserve/write/publish
+    sequence: the server side sends from both the main process and the
+    listener process's client threads, and a `threading.Lock` copied
+    across fork cannot serialize those.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY,
+                 producer_lock=None):
+        if shared_memory is None:
+            raise RuntimeError("shared_memory requires Python >= 3.8")
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(create=True, size=capacity)
+        self.name = self.shm.name
+        self._head = Value('Q', 0, lock=False)  # Bytes produced
+        self._tail = Value('Q', 0, lock=False)  # Bytes consumed
+        self._closed = Value('b', 0, lock=False)
+        self._producer_lock = producer_lock
+
+    # The shared counters and lock travel to child processes via the
+    # forking pickler; the mapping is re-attached by name on the far side
+    def __getstate__(self):
+        return (self.name, self.capacity, self._head, self._tail,
+                self._closed, self._producer_lock)
+
+    def __setstate__(self, state):
+        (self.name, self.capacity, self._head, self._tail,
+         self._closed, self._producer_lock) = state
+        self.shm = shared_memory.SharedMemory(name=self.name)
+
+    def _used(self) -> int:
+        return self._head.value - self._tail.value
+
+    def _copy_in(self, offset: int, data: bytes) -> None:
+        pos = offset % self.capacity
+        first = min(len(data), self.capacity - pos)
+        self.shm.buf[pos:pos + first] = data[:first]
+        if first < len(data):  # Wrap around
+            self.shm.buf[0:len(data) - first] = data[first:]
+
+    def _copy_out(self, offset: int, n: int) -> bytes:
+        pos = offset % self.capacity
+        first = min(n, self.capacity - pos)
+        data = bytes(self.shm.buf[pos:pos + first])
+        if first < n:  # Wrap around
+            data += bytes(self.shm.buf[0:n - first])
+        return data
+
+    def send_bytes(self, payload: bytes) -> None:
+        frame = len(payload).to_bytes(HEADER_SIZE, "little") + payload
+        if len(frame) > self.capacity:
+            raise ValueError(
+                f"Message of {len(payload)} bytes exceeds ring capacity")
+        if self._producer_lock is not None:
+            with self._producer_lock:
+                self._send_frame(frame)
+        else:
+            self._send_frame(frame)
+
+    def _send_frame(self, frame: bytes) -> None:
+        while self.capacity - self._used() < len(frame):
+            if self._closed.value:
+                raise BrokenPipeError("Ring buffer closed")
+            time.sleep(SPIN_SLEEP)  # Wait for the consumer to catch up
+        if self._closed.value:
+            raise BrokenPipeError("Ring buffer closed")
+        self._copy_in(self._head.value, frame)
+        # Publish only after the frame is fully written
+        self._head.value += len(frame)
+
+    def poll(self, timeout=0.0) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._used() < HEADER_SIZE:
+            if self._closed.value:
+                # Like Connection.poll at EOF: recv won't block
+                # (it raises EOFError)
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(SPIN_SLEEP)
+        return True
+
+    def recv_bytes(self) -> bytes:
+        # Pending frames are still delivered after close; EOFError
+        # comes once the ring is drained, like a Connection
+        while self._used() < HEADER_SIZE:
+            if self._closed.value:
+                raise EOFError
+            time.sleep(SPIN_SLEEP)
+        length = int.from_bytes(
+            self._copy_out(self._tail.value, HEADER_SIZE), "little")
+        while self._used() < HEADER_SIZE + length:
+            if self._closed.value:
+                raise EOFError  # Peer went away mid-frame
+            time.sleep(SPIN_SLEEP)  # Frame still being written
+        payload = self._copy_out(self._tail.value + HEADER_SIZE, length)
+        # Free the space only after the payload is copied out
+        self._tail.value += HEADER_SIZE + length
+        return payload
+
+    def close(self) -> None:
+        # Signal EOF and unlink the segment's name. The mapping itself
+        # is left to the garbage collector: both endpoints of a pipe
+        # share the channel objects within a process, so unmapping here
+        # would yank the buffer from a peer still draining frames
+        self._closed.value = 1
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class RingBufferConnection:
+    r"""One endpoint of a bidirectional channel: sends on one ring,
+    receives on the other."""
+
+    def __init__(self, send_ring: RingBufferChannel,
+                 recv_ring: RingBufferChannel):
+        self._send_ring = send_ring
+        self._recv_ring = recv_ring
+
+    def send_bytes(self, payload: bytes) -> None:
+        self._send_ring.send_bytes(payload)
+
+    def recv_bytes(self) -> bytes:
+        return self._recv_ring.recv_bytes()
+
+    def poll(self, timeout=0.0) -> bool:
+        return self._recv_ring.poll(timeout)
+
+    def close(self) -> None:
+        self._send_ring.close()
+        self._recv_ring.close()
+
+
+def ring_buffer_pipe(capacity: int = DEFAULT_CAPACITY):
+    r"""Drop-in for ``multiprocessing.Pipe()`` (bytes API only):
+    returns two connected endpoints backed by a pair of rings, each
+    with its own cross-process producer lock."""
+    there = RingBufferChannel(capacity, producer_lock=Lock())
+    back = RingBufferChannel(capacity, producer_lock=Lock())
+    return RingBufferConnection(there, back), RingBufferConnection(back, there)
@@ -1,5 +1,8 @@
 r"""Simple Convolutional Neural Networks on the Yale Face training dataset."""
 
+import os
+import json
+import hashlib
 import numpy as np
 from random import shuffle
 import copy
@@ -7,7 +10,9 @@ import tempfile
 from argparse import Namespace
 
 from functools import partial
+from multiprocessing import Manager
 from multiprocessing.pool import ThreadPool
+from concurrent.futures import ProcessPoolExecutor
 
 # from keras.datasets import mnist
 from sklearn.model_selection import KFold
@@ -40,12 +45,10 @@ class Net(nn.Module):
         self.maxpool1 = nn.MaxPool2d(args.maxpool1)
         self.maxpool2 = nn.MaxPool2d(args.maxpool2)
         
-        # Calculate the input of Linear layer
-        conv1_out = self.get_output_shape(self.maxpool1, self.get_output_shape(self.conv1, self.expected_input_shape))
-        conv2_out = self.get_output_shape(self.maxpool2, self.get_output_shape(self.conv2, conv1_out)) 
-        fc1_in = np.prod(list(conv2_out)) # Flatten
-
-        self.fc1 = nn.Linear(fc1_in, 38)
+        # Global average pooling collapses each feature map to one
+        # value, so fc1 only needs conv2's channel count as input
+        # instead of the full flattened feature map (~2M params before)
+        self.fc1 = nn.Linear(args.conv2, 38)
 
     def forward(self, x):
         x = self.conv1(x) # input: 1x192x168, output: 32x190x166
@@ -54,33 +57,46 @@ class Net(nn.Module):
         x = self.conv2(x) 
         x = F.relu(x)
         x = self.maxpool2(x) 
-        x = self.dropout1(x) 
-        x = torch.flatten(x, 1) 
-        x = self.fc1(x) 
+        x = self.dropout1(x)
+        x = F.adaptive_avg_pool2d(x, 1)
+        x = torch.flatten(x, 1)
+        x = self.fc1(x)
 #         x = F.relu(x)
 #         x = self.dropout2(x)
 #         x = self.fc2(x)
-        output = F.log_softmax(x, dim=1)
-        # output = torch.sigmoid(x)
-        return output
+        # Raw logits; cross_entropy fuses the log_softmax that used
+        # to live here with the nll_loss in the training loop
+        return x
     
     # TODO: Use from utils instead
     def get_output_shape(self, model, image_dim):
         return model(torch.rand(*(image_dim))).data.shape
 
-def train(args, model, device, train_loader, optimizer, epoch):    
+def train(args, model, device, train_loader, optimizer, epoch,
+          scaler=None, amp_dtype=None):
     model.train()
-    
+
     loss_sum = 0
     count = 1
     for batch_idx, (data, target) in enumerate(train_loader):
-        data, target = data.to(device), target.to(device)
-        optimizer.zero_grad()
-        output = model(data)
-        loss = F.nll_loss(output, target)
-        # loss = F.cross_entropy(output, target)
-        loss.backward()
-        optimizer.step()
+        # non_blocking overlaps the H2D copy with compute (inputs are
+        # pinned); channels_last matches the layout tensor cores want
+        data = data.to(device, memory_format=torch.channels_last, non_blocking=True)
+        target = target.to(device, non_blocking=True)
+        optimizer.zero_grad(set_to_none=True)
+        # Run forward/loss in reduced precision on tensor cores.
+        # GradScaler is a no-op for bf16 (enabled=False) but needed
+        # to avoid underflow with fp16
+        with torch.autocast("cuda", dtype=amp_dtype, enabled=amp_dtype is not None):
+            output = model(data)
+            loss = F.cross_entropy(output, target)
+        if scaler is not None:
+            scaler.scale(loss).backward()
+            scaler.step(optimizer)
+            scaler.update()
+        else:
+            loss.backward()
+            optimizer.step()
         loss_sum += loss.item()
 
     loss_avg = loss_sum/len(train_loader.dataset)
@@ -89,17 +105,18 @@ def train(args, model, device, train_loader, optimizer, epoch):
     
     return loss_avg
     
-def test(args, model, device, test_loader):
+def test(args, model, device, test_loader, amp_dtype=None):
     model.eval()
     test_loss = 0
     correct = 0
     with torch.no_grad():
         for data, target in test_loader:
-            data, target = data.to(device), target.to(device)
-            output = model(data)
-            test_loss += F.nll_loss(output, target, reduction='sum').item()  # sum up batch loss
-            # test_loss += F.cross_entropy(output, target, reduction='sum').item()
-            pred = output.argmax(dim=1, keepdim=True)  # get the index of the max log-probability
+            data = data.to(device, memory_format=torch.channels_last, non_blocking=True)
+            target = target.to(device, non_blocking=True)
+            with torch.autocast("cuda", dtype=amp_dtype, enabled=amp_dtype is not None):
+                output = model(data)
+            test_loss += F.cross_entropy(output, target, reduction='sum').item()  # sum up batch loss
+            pred = output.argmax(dim=1, keepdim=True)  # argmax on logits == argmax on log-probs
             correct += pred.eq(target.view_as(pred)).sum().item()
     test_loss /= len(test_loader.dataset)
     test_acc = correct / len(test_loader.dataset)
@@ -107,31 +124,59 @@ def test(args, model, device, test_loader):
     return test_loss, test_acc
 
 def run_train_net_once(yaleData, train_idx, test_idx, args):
-    trainFaces = torch.utils.data.Subset(yaleData, train_idx)
-    testFaces = torch.utils.data.Subset(yaleData, test_idx)
-    
     use_cuda = not args.no_cuda and torch.cuda.is_available()
     torch.manual_seed(args.seed)
     device = torch.device("cuda" if use_cuda else "cpu")
 
-    kwargs = {'num_workers': 1, 'pin_memory': True} if use_cuda else {}
+    if use_cuda and isinstance(yaleData, CachedYaleDataset):
+        # One host-to-device copy for the whole stack, then each fold
+        # and batch is an on-GPU index view
+        images = yaleData.images.to(device)
+        labels = yaleData.labels.to(device)
+        train_loader = GpuFoldLoader(images, labels, train_idx,
+            args.batch_size, shuffle=True, transform=yaleData.transform)
+        test_loader = GpuFoldLoader(images, labels, test_idx,
+            args.test_batch_size, transform=yaleData.transform)
+    else:
+        trainFaces = torch.utils.data.Subset(yaleData, train_idx)
+        testFaces = torch.utils.data.Subset(yaleData, test_idx)
+
+        # The per-image decode/jitter work is Python-heavy, so use
+        # several worker processes and keep them alive across epochs
+        kwargs = {'num_workers': min(4, os.cpu_count() or 1),
+                  'pin_memory': True,
+                  'persistent_workers': True,
+                  'prefetch_factor': 4} if use_cuda else {}
+
+        train_loader = torch.utils.data.DataLoader(trainFaces,
+            batch_size=args.batch_size, shuffle=True, **kwargs)
+        test_loader = torch.utils.data.DataLoader(testFaces,
+            batch_size=args.test_batch_size, shuffle=False, **kwargs)
+    model = Net(args).to(device, memory_format=torch.channels_last)
+    if use_cuda and hasattr(torch, "compile"):
+        # Fuse the conv+relu+pool chains into a handful of kernels
+        model = torch.compile(model, mode="reduce-overhead")
+
 
-    train_loader = torch.utils.data.DataLoader(trainFaces,
-        batch_size=args.batch_size, shuffle=True, **kwargs)
-    test_loader = torch.utils.data.DataLoader(testFaces,
-        batch_size=args.test_batch_size, shuffle=False, **kwargs)
-    model = Net(args).to(device)
-    
     optimizer = optim.Adadelta(model.parameters(), lr=args.lr)
     scheduler = StepLR(optimizer, step_size=2, gamma=args.gamma)
 
+    # Mixed precision on CUDA: prefer bf16 (no loss scaling needed),
+    # fall back to fp16 + GradScaler on older GPUs
+    amp_dtype, scaler = None, None
+    if use_cuda:
+        amp_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() \
+                    else torch.float16
+        scaler = torch.cuda.amp.GradScaler(enabled=amp_dtype == torch.float16)
+
     test_loss = []
     test_acc = []
     train_loss = []
 
     for epoch in range(1, args.epochs + 1):
-        train_loss.append(train(args, model, device, train_loader, optimizer, epoch))
-        results = test(args, model, device, test_loader)
+        train_loss.append(train(args, model, device, train_loader, optimizer, epoch,
+                                scaler=scaler, amp_dtype=amp_dtype))
+        results = test(args, model, device, test_loader, amp_dtype=amp_dtype)
         test_loss.append(results[0])
         test_acc.append(results[1])
         scheduler.step()
@@ -141,21 +186,127 @@ def run_train_net_once(yaleData, train_idx, test_idx, args):
 
     return test_acc[-1]
 
+class CachedYaleDataset(Dataset):
+    """Dataset over pre-decoded image tensors. The deterministic
+    decode/grayscale/resize work is done once up front; only the
+    random ColorJitter runs per access."""
+
+    def __init__(self, images, labels, transform=None):
+        self.images = images
+        self.labels = labels
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        x = self.images[idx]
+        if self.transform is not None:
+            x = self.transform(x)
+        return x, self.labels[idx]
+
+def load_yale_dataset(args):
+    """Decode, grayscale and resize the dataset once and cache the
+    tensor stack on disk, content-addressed by the config that affects
+    this stage. Candidates that only vary training hyperparameters
+    (lr, batch_size, ...) skip the PIL pipeline entirely."""
+    stage_config = {"data_folder": args.data_folder, "size": [192, 168]}
+    key = hashlib.sha1(
+        json.dumps(stage_config, sort_keys=True).encode()).hexdigest()[:16]
+    cache_path = os.path.join(tempfile.gettempdir(), f"yale_{key}.pt")
+
+    if os.path.exists(cache_path):
+        images, labels = torch.load(cache_path)
+    else:
+        base = ImageFolder(args.data_folder,
+                           transform=transforms.Compose([
+                               transforms.Grayscale(),
+                               transforms.Resize((192,168), interpolation=0),
+                               transforms.ToTensor()
+                           ]))
+        loader = DataLoader(base, batch_size=256)
+        image_batches, label_batches = [], []
+        for x, y in loader:
+            image_batches.append(x)
+            label_batches.append(y)
+        images, labels = torch.cat(image_batches), torch.cat(label_batches)
+        torch.save((images, labels), cache_path)
+
+    jitter = transforms.ColorJitter(brightness=.5, contrast=.3)
+    return CachedYaleDataset(images, labels, transform=jitter)
+
+class GpuFoldLoader:
+    """Batched views over a device-resident tensor stack. Once the
+    whole dataset sits on the GPU, a fold's loader is just integer
+    indexing: each batch is one gather, with no worker processes, PIL,
+    or host-to-device copies in the loop. The random ColorJitter is
+    applied to the batched tensor (one parameter draw per batch)."""
+
+    def __init__(self, images, labels, idx, batch_size,
+                 shuffle=False, transform=None):
+        self.images = images
+        self.labels = labels
+        self.idx = torch.as_tensor(idx, device=images.device)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.transform = transform
+        self.dataset = idx # So len(loader.dataset) keeps working
+
+    def __len__(self):
+        return (len(self.idx) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        if self.shuffle:
+            order = torch.randperm(len(self.idx), device=self.idx.device)
+        else:
+            order = torch.arange(len(self.idx), device=self.idx.device)
+        for start in range(0, len(self.idx), self.batch_size):
+            sel = self.idx[order[start:start + self.batch_size]]
+            x = self.images[sel]
+            if self.transform is not None:
+                x = self.transform(x)
+            yield x, self.labels[sel]
+
+def _pin_worker_gpu(device_queue):
+    """Bind a pool worker to one GPU. CUDA_VISIBLE_DEVICES only takes
+    effect before the worker's first CUDA init and workers are reused
+    across folds, so the device must be fixed once per worker (here,
+    in the pool initializer), not per submitted fold."""
+    os.environ["CUDA_VISIBLE_DEVICES"] = str(device_queue.get())
+
+def _run_fold(fold, yaleData, train_idx, test_idx, args):
+    print("Fold", fold)
+    return run_train_net_once(yaleData, train_idx, test_idx, args)
+
 def run_train_net_kfold(args):
-    yaleData = ImageFolder(args.data_folder,
-                       transform=transforms.Compose([
-                           transforms.Grayscale(),
-                           transforms.Resize((192,168), interpolation=0),
-                           transforms.ColorJitter(brightness=.5, contrast=.3), # Random recolorization every load.
-                           transforms.ToTensor()
-                       ]))
+    yaleData = load_yale_dataset(args)
     kfold = KFold(n_splits=args.num_folds, shuffle=True, random_state=args.seed)
-    
-    results = []
-    for i, (train_idx, test_idx) in enumerate(kfold.split(yaleData)):
-        print("Fold", i)
-        test_accuracy = run_train_net_once(yaleData, train_idx, test_idx, args)
-        results.append(test_accuracy)
+    folds = list(kfold.split(yaleData))
+
+    num_parallel = getattr(args, "num_parallel_folds", 1)
+    if num_parallel > 1:
+        # Folds are fully independent, so train them in worker
+        # processes, one GPU per worker (round-robin over visible GPUs)
+        num_gpus = torch.cuda.device_count() if not args.no_cuda else 0
+        pool_kwargs = {}
+        if num_gpus > 0:
+            device_queue = Manager().Queue()
+            for worker in range(num_parallel):
+                device_queue.put(worker % num_gpus)
+            pool_kwargs = {"initializer": _pin_worker_gpu,
+                           "initargs": (device_queue,)}
+        with ProcessPoolExecutor(max_workers=num_parallel,
+                                 **pool_kwargs) as pool:
+            futures = [pool.submit(_run_fold, i, yaleData, train_idx, test_idx,
+                                   args)
+                       for i, (train_idx, test_idx) in enumerate(folds)]
+            results = [future.result() for future in futures]
+    else:
+        results = []
+        for i, (train_idx, test_idx) in enumerate(folds):
+            print("Fold", i)
+            test_accuracy = run_train_net_once(yaleData, train_idx, test_idx, args)
+            results.append(test_accuracy)
 
     mean = np.mean(results)
     variance = np.std(results) ** 2
@@ -173,16 +324,17 @@ if __name__ == "__main__":
         dropout1=0.174,
         maxpool1=4,
         maxpool2=8,
-        no_cuda=False, 
-        seed=1, 
-        batch_size=7,
+        no_cuda=False,
+        seed=1,
+        batch_size=128,
         test_batch_size=1000,
         epochs=23,
         lr=5.1,
         gamma=0.7,
         log_interval=250, # was 250
         save_model=False,
-        num_folds = 5
+        num_folds = 5,
+        num_parallel_folds = 1 # Set to #GPUs to train folds concurrently
     )
     args_test = Namespace(
         data_folder='~/pj/dopt_v2/data/CroppedYale/',
@@ -193,15 +345,16 @@ if __name__ == "__main__":
         dropout1=0.3137296707226549,
         maxpool1=3,
         maxpool2=9,
-        no_cuda=False, 
-        seed=1, 
-        batch_size=7,
+        no_cuda=False,
+        seed=1,
+        batch_size=128,
         test_batch_size=1000,
         epochs=1,
         lr=9.600909710430093,
         gamma=0.7,
         log_interval=250, # was 250
         save_model=False,
-        num_folds = 5
+        num_folds = 5,
+        num_parallel_folds = 1 # Set to #GPUs to train folds concurrently
     )
     run_train_net_kfold(args_test)
\ No newline at end of file